@@ -0,0 +1,136 @@
+import json
+import os
+from types import MappingProxyType
+from typing import NamedTuple, Mapping
+
+DATA_DIR = "data"  # Every league gets its own sub-directory (shard) below this one
+LEGACY_DB_FILES = {"elo.db": "elo_db_path", "matches.db": "match_db_path"}  # Databases from before sharding
+MAX_CHOICES = 25  # Discord's limit for the choices of a slash command option
+
+
+class LeagueError(ValueError):
+    """Raised when a command refers to a league or division that is not configured; the message is user-facing."""
+
+
+class Division(NamedTuple):
+    name: str
+    sheet_key: str
+    k_factor: int
+
+
+class League(NamedTuple):
+    """
+    Immutable configuration for a single league (community).
+
+    Attributes:
+        name (str): The league name, also used as the name of its storage shard.
+        guild_id (int): The Discord server the league runs in.
+        moderator_channel_id (int): Channel that receives match submissions for review.
+        leaderboard_channel_id (int): Channel the daily leaderboard is posted in.
+        output_key (str): Google Sheet key the match overview is written to.
+        season (str): The current season, used to partition analytics exports.
+        divisions (Mapping[str, Division]): The divisions of the league by name.
+    """
+    name: str
+    guild_id: int
+    moderator_channel_id: int
+    leaderboard_channel_id: int
+    output_key: str
+    divisions: Mapping[str, Division]
+    season: str = "1"
+
+    @property
+    def data_dir(self):
+        return os.path.join(DATA_DIR, self.name)
+
+    @property
+    def elo_db_path(self):
+        return os.path.join(self.data_dir, "elo.db")
+
+    @property
+    def match_db_path(self):
+        return os.path.join(self.data_dir, "matches.db")
+
+    @property
+    def outbox_db_path(self):
+        return os.path.join(self.data_dir, "outbox.db")
+
+    def division(self, division_name):
+        if division_name not in self.divisions:
+            raise LeagueError(f"Division {division_name} is not part of the {self.name} league.")
+        return self.divisions[division_name]
+
+
+def load_leagues(path="leagues.json", names=None):
+    """
+    Loads the league/division configuration table into a read-only map.
+
+    Args:
+        path (str): Path to the JSON configuration file.
+        names (list): Optional list of league names to load, so leagues can be split across bot processes.
+                      All leagues in the file are loaded when omitted.
+
+    Returns:
+        MappingProxyType: A read-only mapping of league name to League.
+    """
+    with open(path, encoding="utf-8") as f:
+        table = json.load(f)
+
+    if names:
+        unknown = set(names) - set(table)
+        if unknown:
+            raise ValueError(f"Unknown league name(s): {', '.join(sorted(unknown))}")
+        table = {name: table[name] for name in names}
+
+    leagues = {}
+    guild_ids = set()
+    for league_name, entry in table.items():
+        divisions = {name: Division(name, division["sheet_key"], int(division["k_factor"]))
+                     for name, division in entry["divisions"].items()}
+        league = League(name=league_name,
+                        guild_id=int(entry["guild_id"]),
+                        moderator_channel_id=int(entry["moderator_channel_id"]),
+                        leaderboard_channel_id=int(entry["leaderboard_channel_id"]),
+                        output_key=entry.get("output_key", ""),
+                        divisions=MappingProxyType(divisions),
+                        season=str(entry.get("season", "1")))
+        if league.guild_id in guild_ids:
+            raise ValueError(f"Guild {league.guild_id} is configured for more than one league")
+        guild_ids.add(league.guild_id)
+        leagues[league_name] = league
+    return MappingProxyType(leagues)
+
+
+def division_choices(leagues):
+    """Returns the sorted, de-duplicated division names across all loaded leagues, for slash command choices."""
+    choices = sorted({name for league in leagues.values() for name in league.divisions})
+    if len(choices) > MAX_CHOICES:
+        raise ValueError(f"{len(choices)} distinct division names are configured, Discord allows at most "
+                         f"{MAX_CHOICES} choices; split the leagues across processes with MATCHBOT_LEAGUES")
+    return choices
+
+
+def migrate_legacy_storage(path="leagues.json", root="."):
+    """
+    Moves the databases of a deployment from before sharding (elo.db and matches.db in the working directory) into
+    the shard of the league. This is only unambiguous when the configuration file holds a single league; with more
+    leagues the bot refuses to start until the files have been moved by hand. The whole file is considered, not just
+    the leagues selected with MATCHBOT_LEAGUES, as those only tell which leagues this process serves.
+    """
+    legacy = [name for name in LEGACY_DB_FILES if os.path.exists(os.path.join(root, name))]
+    if not legacy:
+        return
+    leagues = load_leagues(path)
+    if len(leagues) != 1:
+        raise RuntimeError(f"Found {', '.join(legacy)} from before per-league storage, but {len(leagues)} leagues are "
+                           f"configured. Move them into {DATA_DIR}/<league>/ of the league they belong to.")
+    league = next(iter(leagues.values()))
+    for name in legacy:
+        target = getattr(league, LEGACY_DB_FILES[name])
+        if os.path.exists(target):
+            raise RuntimeError(f"Both {name} and {target} exist; remove or merge one of them before starting.")
+        os.makedirs(league.data_dir, exist_ok=True)
+        for suffix in ("", "-journal", "-wal", "-shm"):
+            if os.path.exists(os.path.join(root, name + suffix)):
+                os.replace(os.path.join(root, name + suffix), target + suffix)
+        print(f"Moved {name} to {target}")
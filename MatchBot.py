@@ -1,56 +1,154 @@
+import asyncio
+import os
+import time
+
 import discord
 from discord.ext import tasks, commands
 import discord.ui
 import aiosqlite
 from views import MatchSubmissionView, PaginationView
 from MatchManager import MatchManager
+from MessageQueue import MessageQueue
+from MatchExport import export_league, ExportError
+from ReplayVerifier import ReplayVerifier
+from LeagueConfig import load_leagues, division_choices, migrate_legacy_storage, LeagueError, DATA_DIR
 
 description = """
 This bot processes match submissions for a Pokémon Draft server called SCDA
 """
 
-MODERATOR_CHANNEL_ID = 123456789 # insert own channel ids
-LEADERBOARD_CHANNEL_ID = 123456789
+LEAGUES_FILE = os.environ.get("MATCHBOT_LEAGUES_FILE", "leagues.json")
+# Leagues served by this process; set MATCHBOT_LEAGUES to a comma-separated list to split leagues across processes
+LEAGUES = load_leagues(LEAGUES_FILE, [name for name in os.environ.get("MATCHBOT_LEAGUES", "").split(",") if name])
+DIVISIONS = division_choices(LEAGUES)
+migrate_legacy_storage(LEAGUES_FILE)
 
 
 class MatchBot(commands.Bot):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, leagues, *args, **kwargs):
         super().__init__(command_prefix="!", description=description, intents=discord.Intents.all(), *args, **kwargs)
 
-        self.match_manager = MatchManager()
+        self.leagues = leagues
+        self.leagues_by_guild = {league.guild_id: league for league in leagues.values()}
+        self.match_managers = {name: MatchManager(league) for name, league in leagues.items()}
+        self.message_queues = {name: MessageQueue(league.outbox_db_path, self) for name, league in leagues.items()}
+        self.replay_verifier = ReplayVerifier(os.path.join(DATA_DIR, "replay_cache"))
+        self.background_tasks = set()
+        self.rating_timelines = {}  # Rendered rating timelines per (league, player), dropped on every new rating
+        self.rating_generations = {}  # Bumped per (league, player) on every new rating, guards the cache above
 
-    @staticmethod
-    async def setup_database():
+    async def close(self):
+        await self.replay_verifier.close()
+        await super().close()
+
+    def league_for(self, ctx):
         """
-        Asynchronously sets up the database for the bot.
-        This function creates a table for players if it doesn't exist, with columns for Discord ID and ELO score.
+        Resolves the league that the server of the given context belongs to.
+
+        Raises:
+            LeagueError: If the command was not used in a server configured for a league served by this process.
         """
-        async with aiosqlite.connect('elo.db') as db:
-            await db.execute('''CREATE TABLE IF NOT EXISTS players (discord_id TEXT PRIMARY KEY, elo INTEGER, division 
-            TEXT DEFAULT NULL)''')
-            await db.commit()
-            print("Finished setting up database")
+        league = self.leagues_by_guild.get(ctx.guild_id)
+        if league is None:
+            raise LeagueError("This command can only be used in a server that is set up for a league.")
+        return league
+
+    async def queue_message(self, ctx, channel_id, content, view=None):
+        """
+        Queues a message on the outbound message queue of the context's league instead of sending it inline.
+
+        Returns:
+            asyncio.Future: Resolves to the sent message for messages with a view, None otherwise.
+        """
+        return await self.message_queues[self.league_for(ctx).name].send(channel_id, content, view=view)
+
+    def follow_up_submission(self, ctx, sent, match, urls, score, opponent):
+        """
+        Follows up on a queued moderator message in the background: verifies the submitted replays and annotates the
+        message with the result, or asks the submitter to resubmit if the message could not be delivered.
+
+        Parameters:
+            ctx (discord.ApplicationContext): The context of the submission command.
+            sent (asyncio.Future): Resolves to the moderator message of the submission, None if it was dropped.
+            match (str): The label of the submitted match.
+            urls (list): The submitted replay URLs.
+            score (str): The submitted score from the submitter's point of view.
+            opponent (str): Name of the opponent.
+        """
+        task = asyncio.create_task(self.annotate_submission(ctx, sent, match, urls, score, opponent))
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    async def annotate_submission(self, ctx, sent, match, urls, score, opponent):
+        verification = asyncio.ensure_future(self.replay_verifier.verify(urls, score, ctx.user.name, opponent))
+        try:
+            message = await sent
+            if message is None:
+                verification.cancel()
+                await self.queue_message(ctx, ctx.channel_id, f"<@{ctx.user.id}> your submission for {match} could "
+                                                              f"not be delivered to the moderators, please submit it "
+                                                              f"again.")
+                return
+            summary = (await verification).summary
+            message = await message.channel.fetch_message(message.id)
+            if message.components:  # Only annotate submissions that are still awaiting review
+                await message.edit(content=f"{message.content}\nReplay check: {summary}")
+        except Exception as e:
+            print(f"Following up on the submission for {match} failed: {e!r}")
+
+    async def setup_database(self):
+        """
+        Asynchronously sets up the databases for the bot.
+        This function creates a table for players in every league shard if it doesn't exist, with columns for
+        Discord ID and ELO score, and a table recording every rating change per player together with the division and
+        season it was earned in.
+        """
+        for league in self.leagues.values():
+            os.makedirs(league.data_dir, exist_ok=True)
+            async with aiosqlite.connect(league.elo_db_path) as db:
+                await db.execute("PRAGMA journal_mode=WAL")
+                await db.execute('''CREATE TABLE IF NOT EXISTS players (discord_id TEXT PRIMARY KEY, elo INTEGER, 
+                division TEXT DEFAULT NULL)''')
+                await db.execute('''CREATE TABLE IF NOT EXISTS rating_history (discord_id TEXT NOT NULL, ts INTEGER NOT 
+                NULL, elo REAL NOT NULL, match_id TEXT DEFAULT NULL, division TEXT DEFAULT NULL, season TEXT DEFAULT 
+                NULL)''')
+                # Rating histories created before division and season were recorded get both columns
+                async with db.execute("PRAGMA table_info(rating_history)") as cursor:
+                    columns = [column[1] for column in await cursor.fetchall()]
+                if "division" not in columns:
+                    await db.execute("ALTER TABLE rating_history ADD COLUMN division TEXT DEFAULT NULL")
+                if "season" not in columns:
+                    await db.execute("ALTER TABLE rating_history ADD COLUMN season TEXT DEFAULT NULL")
+                    await db.execute("UPDATE rating_history SET season = ?", (league.season,))
+                await db.execute('CREATE INDEX IF NOT EXISTS idx_rating_history_player ON rating_history (discord_id, '
+                                 'ts)')
+                # Players from before the rating history existed start their history with their current rating
+                await db.execute('INSERT INTO rating_history (discord_id, ts, elo, division, season) SELECT discord_id, '
+                                 '?, elo, division, ? FROM players WHERE elo IS NOT NULL AND NOT EXISTS (SELECT 1 FROM '
+                                 'rating_history)', (int(time.time()), league.season))
+                await db.commit()
+                print(f"Finished setting up database for {league.name}")
 
     @staticmethod
-    async def get_top_players():
+    async def get_top_players(league):
         """
-        Retrieves the top 20 players sorted by ELO score in descending order.
+        Retrieves the top 20 players of a league sorted by ELO score in descending order.
 
         Returns:
             list: A list of tuples containing the player's Discord ID and their ELO score.
         """
-        async with aiosqlite.connect("elo.db") as db:
+        async with aiosqlite.connect(league.elo_db_path) as db:
             async with db.execute('SELECT * FROM players ORDER BY elo DESC LIMIT 20') as cursor:
                 return await cursor.fetchall()
 
     @staticmethod
-    async def get_all_players():
-        async with aiosqlite.connect('elo.db') as db:
+    async def get_all_players(league):
+        async with aiosqlite.connect(league.elo_db_path) as db:
             async with db.execute('SELECT discord_id, elo FROM players ORDER BY elo DESC') as cursor:
                 return await cursor.fetchall()
 
-    async def fetch_players_in_division(self, division):
-        async with aiosqlite.connect('elo.db') as db:
+    async def fetch_players_in_division(self, league, division):
+        async with aiosqlite.connect(league.elo_db_path) as db:
             cursor = await db.execute("SELECT discord_id FROM players WHERE division = ?", (division,))
             players = await cursor.fetchall()
 
@@ -61,11 +159,13 @@ class MatchBot(commands.Bot):
         return users
 
     async def process_match_result(self, ctx, match, opp, score, urls, division):
-        await self.match_manager.update_match_result(match[1], score, urls)
-        await self.update_elo(ctx, opp, score, division)
+        league = self.league_for(ctx)
+        await self.match_managers[league.name].update_match_result(match[1], score, urls)
+        await self.update_elo(ctx, opp, score, league.division(division), match[1])
 
-    async def update_elo(self, ctx, opp, score, division):
-        async with aiosqlite.connect("elo.db") as db:
+    async def update_elo(self, ctx, opp, score, division, match_id=None):
+        league = self.league_for(ctx)
+        async with aiosqlite.connect(league.elo_db_path) as db:
             cursor = await db.execute("SELECT elo FROM players WHERE discord_id IN (?, ?)", (ctx.user.id, opp[1]))
             elos = await cursor.fetchall()
             player1_elo, player2_elo = elos[0][0], elos[1][0]
@@ -76,33 +176,121 @@ class MatchBot(commands.Bot):
             result_team2 = 1 - result_team1
 
             # Calculate new ELOs
-            new_elo1 = self.calculate_elo_change(player1_elo, player2_elo, result_team1, division)
-            new_elo2 = self.calculate_elo_change(player2_elo, player1_elo, result_team2, division)
+            new_elo1 = self.calculate_elo_change(player1_elo, player2_elo, result_team1, division.k_factor)
+            new_elo2 = self.calculate_elo_change(player2_elo, player1_elo, result_team2, division.k_factor)
 
             # Update ELOs in the database
             await db.execute("UPDATE players SET elo=? WHERE discord_id=?", (new_elo1, ctx.user.id))
             await db.execute("UPDATE players SET elo=? WHERE discord_id=?", (new_elo2, opp[1]))
+            # Record the history in the same transaction so it never disagrees with the current ratings
+            await self.record_ratings(db, league, [(ctx.user.id, new_elo1), (opp[1], new_elo2)], match_id,
+                                      division.name)
             await db.commit()
+        for discord_id in (ctx.user.id, opp[1]):
+            self.invalidate_rating_timeline(league, discord_id)
+
+    def invalidate_rating_timeline(self, league, discord_id):
+        """
+        Drops the cached timeline of a player after a new rating entry has been committed. Bumping the generation also
+        stops a read that started before the commit from caching its outdated timeline.
+        """
+        key = (league.name, str(discord_id))
+        self.rating_generations[key] = self.rating_generations.get(key, 0) + 1
+        self.rating_timelines.pop(key, None)
 
     @staticmethod
-    def calculate_elo_change(current_elo, opponent_elo, result, division):
-        k = 32 if division == "Poke" else 16 if division == "Ultra" else 24
+    async def record_ratings(db, league, ratings, match_id=None, division=None):
+        """
+        Appends rating entries to the rating history. Does not commit, so it joins the caller's transaction.
+
+        Parameters:
+            db (aiosqlite.Connection): Connection to the league's ELO database.
+            league (League): The league, whose current season is recorded with the entries.
+            ratings (list): Tuples of Discord ID and new rating.
+            match_id (str): The match that caused the change, if any.
+            division (str): The division the match was played in, if any.
+        """
+        ts = int(time.time())
+        await db.executemany("INSERT INTO rating_history (discord_id, ts, elo, match_id, division, season) "
+                             "VALUES (?, ?, ?, ?, ?, ?)",
+                             [(str(discord_id), ts, elo, match_id, division, league.season)
+                              for discord_id, elo in ratings])
+
+    @staticmethod
+    async def get_rating_history(league, discord_id, limit=20):
+        """
+        Retrieves the most recent rating entries of a player, oldest first. Served from the (discord_id, ts) index.
+
+        Returns:
+            list: A list of tuples containing the timestamp and the rating.
+        """
+        async with aiosqlite.connect(league.elo_db_path) as db:
+            async with db.execute('SELECT ts, elo FROM rating_history WHERE discord_id = ? ORDER BY ts DESC, rowid DESC '
+                                  'LIMIT ?',
+                                  (str(discord_id), limit)) as cursor:
+                history = await cursor.fetchall()
+        return history[::-1]
+
+    async def get_rating_timeline(self, league, discord_id):
+        """
+        Returns the rendered rating timeline of a player, cached until the player's rating changes again.
+        """
+        key = (league.name, str(discord_id))
+        if key in self.rating_timelines:
+            return self.rating_timelines[key]
+        generation = self.rating_generations.get(key, 0)
+        timeline = self.render_timeline(await self.get_rating_history(league, discord_id))
+        # Only cache when no rating arrived while reading, and never cache an empty history
+        if timeline is not None and self.rating_generations.get(key, 0) == generation:
+            self.rating_timelines[key] = timeline
+        return timeline
+
+    @staticmethod
+    def render_timeline(history):
+        """
+        Renders rating entries as a text sparkline followed by the individual entries.
+        """
+        if not history:
+            return None
+        bars = "▁▂▃▄▅▆▇█"
+        elos = [elo for _, elo in history]
+        low, high = min(elos), max(elos)
+        spread = (high - low) or 1
+        sparkline = "".join(bars[int((elo - low) / spread * (len(bars) - 1))] for elo in elos)
+        lines = [f"<t:{ts}:d> - {round(elo)}" for ts, elo in history]
+        return f"`{sparkline}`\n" + "\n".join(lines)
+
+    @staticmethod
+    def calculate_elo_change(current_elo, opponent_elo, result, k):
         expected_score = 1 / (1 + 10 ** ((opponent_elo - current_elo) / 400))
         new_elo = current_elo + k * (result - expected_score)
         return new_elo
 
 
-bot = MatchBot()
+bot = MatchBot(LEAGUES)
 
 
 @tasks.loop(hours=24)
 async def update_leaderboard():
     """
-    A scheduled task that updates the leaderboard every 24 hours.
-    Fetches the top players, constructs an embed with their rankings, and posts or updates it in the leaderboard channel
+    A scheduled task that updates the leaderboards every 24 hours.
+    Posts or updates the leaderboard of every league in its own leaderboard channel.
+    """
+    for league in bot.leagues.values():
+        # One league's unreachable channel or player must not stop the leaderboards of the others
+        try:
+            await post_leaderboard(league)
+        except Exception as e:
+            print(f"Failed to update the leaderboard for {league.name}: {e!r}")
+
+
+async def post_leaderboard(league):
+    """
+    Fetches the top players of a league, constructs an embed with their rankings, and posts or updates it in the
+    league's leaderboard channel
     """
-    channel = bot.get_channel(LEADERBOARD_CHANNEL_ID)
-    top_players = await bot.get_top_players()
+    channel = bot.get_channel(league.leaderboard_channel_id)
+    top_players = await bot.get_top_players(league)
     embed = discord.Embed(title="🏆 Top 20 Players 🏆", description="ELO Leaderboard", color=0x1E90FF)
     leaderboard_lines = []
 
@@ -126,10 +314,22 @@ async def on_ready():
     print(f"Logged in as {bot.user} (ID: {bot.user.id})")
     print("------")
     await bot.setup_database()
-    await bot.match_manager.setup_match_database()
+    for match_manager in bot.match_managers.values():
+        await match_manager.setup_match_database()
+    for message_queue in bot.message_queues.values():
+        await message_queue.setup()
     update_leaderboard.start()
 
 
+@bot.event
+async def on_application_command_error(ctx: discord.ApplicationContext, error: discord.DiscordException):
+    """Tells the user why a command failed when it refers to a league or division that is not configured."""
+    if isinstance(error, discord.ApplicationCommandInvokeError) and isinstance(error.original, LeagueError):
+        await ctx.respond(str(error.original), ephemeral=True)
+    else:
+        raise error
+
+
 @bot.slash_command(name="player_card", description="Displays your SCDA Player Card.")
 @discord.default_permissions()
 async def player_card(ctx: discord.ApplicationContext):
@@ -137,7 +337,7 @@ async def player_card(ctx: discord.ApplicationContext):
     A slash command that allows users to query their current ELO score.
     Responds with an ephemeral message displaying the user's ELO score, ensuring privacy.
     """
-    async with aiosqlite.connect('elo.db') as db:
+    async with aiosqlite.connect(bot.league_for(ctx).elo_db_path) as db:
         async with db.execute('SELECT elo, division FROM players WHERE discord_id = ?',
                               (str(ctx.author.id),)) as cursor:
             player = await cursor.fetchone()
@@ -154,11 +354,24 @@ async def player_card(ctx: discord.ApplicationContext):
                 await ctx.respond("You are not registered.", ephemeral=True)
 
 
+@bot.slash_command(name="rating_history", description="Shows how your ELO has developed over your last matches.")
+@discord.default_permissions()
+async def rating_history(ctx: discord.ApplicationContext):
+    timeline = await bot.get_rating_timeline(bot.league_for(ctx), ctx.author.id)
+    if timeline:
+        embed = discord.Embed(title=f"{ctx.author.display_name}'s ELO History", description=timeline,
+                              color=discord.Color.gold())
+        embed.set_footer(text="Silph Co. Draft Association")
+        await ctx.respond(embed=embed, ephemeral=True)
+    else:
+        await ctx.respond("No rating history found.", ephemeral=True)
+
+
 @bot.slash_command(name="all_players", description="Shows all registered players and their ELO.")
 @commands.has_permissions(administrator=True)
 @discord.default_permissions()
 async def all_players(ctx: discord.ApplicationContext):
-    players_data = await bot.get_all_players()
+    players_data = await bot.get_all_players(bot.league_for(ctx))
     formatted_data = []
 
     for player_id, elo in players_data:
@@ -179,14 +392,17 @@ async def register(ctx: discord.ApplicationContext):
     Registers the user in the database with an initial ELO score of 1200.
     If the user is already registered, it informs them without making any changes.
     """
-    async with aiosqlite.connect('elo.db') as db:
+    league = bot.league_for(ctx)
+    async with aiosqlite.connect(league.elo_db_path) as db:
         discord_id = str(ctx.author.id)
         async with db.execute('SELECT * FROM players WHERE discord_id = ?', (discord_id,)) as cursor:
             if await cursor.fetchone():
                 await ctx.respond("You are already registered.", ephemeral=True)
             else:
                 await db.execute('INSERT INTO players (discord_id, elo) VALUES (?, ?)', (discord_id, 1200))
+                await bot.record_ratings(db, league, [(discord_id, 1200)])
                 await db.commit()
+                bot.invalidate_rating_timeline(league, discord_id)
                 await ctx.respond("You have been registered with an initial ELO of 1200. Being sorted into a skill "
                                   "dependent division will add or subtract a small amount.", ephemeral=True)
 
@@ -197,10 +413,12 @@ async def register(ctx: discord.ApplicationContext):
 async def assign_division(
     ctx: discord.ApplicationContext,
     player_ids: str,  # Player IDs as a comma-separated string
-    division: discord.Option(str, "Select a division", choices=["Ultra", "Poke", "Premier", "Test"])
+    division: discord.Option(str, "Select a division", choices=DIVISIONS)
 ):
+    league = bot.league_for(ctx)
+    league.division(division)  # Make sure the division exists in this league
     ids = player_ids.split(',')  # Split the string into individual IDs
-    async with aiosqlite.connect('elo.db') as db:
+    async with aiosqlite.connect(league.elo_db_path) as db:
         for player_id in ids:
             # Trim whitespace and update each player's division
             await db.execute('UPDATE players SET division = ? WHERE discord_id = ?', (division, player_id.strip()))
@@ -213,25 +431,43 @@ async def assign_division(
 @commands.has_permissions(administrator=True)
 @discord.default_permissions()
 async def start_season(ctx: discord.ApplicationContext):
-    divisions = ["Ultra", "Poke", "Premier", "Test"]
-    for division in divisions:
-        await bot.match_manager.add_matches_for_division(division)
+    league = bot.league_for(ctx)
+    match_manager = bot.match_managers[league.name]
+    for division in league.divisions:
+        await match_manager.add_matches_for_division(division)
 
-    await bot.match_manager.write_matches_to_sheet()
+    await match_manager.write_matches_to_sheet()
     await ctx.respond("All matches are now added to the database.", ephemeral=True)
 
 
+@bot.slash_command(description="Export the matches and ratings changed since the last export to CSV files.")
+@commands.has_permissions(administrator=True)
+@discord.default_permissions()
+async def export_data(ctx: discord.ApplicationContext):
+    await ctx.defer(ephemeral=True)
+    try:
+        exported = await export_league(bot.league_for(ctx))
+    except ExportError as e:
+        await ctx.respond(str(e), ephemeral=True)
+        return
+    await ctx.respond(f"Exported {exported['matches']} match row(s) and {exported['ratings']} rating row(s).",
+                      ephemeral=True)
+
+
 @bot.slash_command(description="Submit your match result")
 @discord.default_permissions()
 async def submit_match(ctx: discord.ApplicationContext,
                        division: discord.Option(str, "Choose your division",
-                                                choices=["Ultra", "Poke", "Premier", "Test"])):
-    matches = await bot.match_manager.fetch_unplayed_matches(division)  # Fetch unplayed matches for the division
-    matches = bot.match_manager.filter_matches(matches)
-    players = await bot.fetch_players_in_division(division)
+                                                choices=DIVISIONS)):
+    league = bot.league_for(ctx)
+    league.division(division)  # Make sure the division exists in this league
+    match_manager = bot.match_managers[league.name]
+    matches = await match_manager.fetch_unplayed_matches(division)  # Fetch unplayed matches for the division
+    matches = match_manager.filter_matches(matches)
+    players = await bot.fetch_players_in_division(league, division)
     if matches:
         # Create and send the match selection view
-        mod = bot.get_channel(MODERATOR_CHANNEL_ID)
+        mod = bot.get_channel(league.moderator_channel_id)
         await ctx.respond("Select your match:", view=MatchSubmissionView(ctx, matches, players, division, mod, bot),
                           ephemeral=True)
     else:
@@ -245,6 +481,7 @@ async def info(ctx: discord.ApplicationContext):
                           color=discord.Color.blue())
     embed.add_field(name="/player_card", value="Displays your current ELO rating and division.", inline=False)
     embed.add_field(name="/register", value="Register a new player in the database.", inline=False)
+    embed.add_field(name="/rating_history", value="Shows how your ELO rating has developed.", inline=False)
     embed.add_field(name="/submit_match", value="Walks player through match submission steps.", inline=False)
     await ctx.respond(embed=embed, ephemeral=True)
 
@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+import aiosqlite
+
+from LeagueConfig import load_leagues
+
+EXPORT_DIR = "exports"
+
+MATCH_COLUMNS = ["id", "week_number", "team1", "team2", "score_team1", "score_team2", "match_played", "replay_url1",
+                 "replay_url2", "replay_url3", "division", "season", "change_seq"]
+RATING_COLUMNS = ["seq", "discord_id", "ts", "elo", "match_id", "division", "season"]
+
+
+class ExportError(RuntimeError):
+    """Raised when an export cannot run; the message is meant for the admin who started it."""
+
+
+@contextmanager
+def export_lock(path):
+    """
+    Holds an exclusive lock on `path` for the duration of an export, so the bot and the CLI never export the same
+    league at the same time. Fails immediately instead of waiting, as waiting would block the bot's event loop.
+    """
+    with open(path, "a+") as f:
+        try:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            raise ExportError("Another export of this league is already running.") from None
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+async def check_schema(db_path, table, required):
+    """
+    Makes sure a database has been upgraded by the bot (which creates the tables and columns the export relies on).
+    """
+    async with aiosqlite.connect(db_path) as db:
+        async with db.execute(f"PRAGMA table_info({table})") as cursor:
+            columns = [row[1] for row in await cursor.fetchall()]
+    missing = [column for column in required if column not in columns]
+    if missing:
+        raise ExportError(f"{db_path} has no {', '.join(f'{table}.{column}' for column in missing)} yet; start the bot "
+                          f"once to upgrade the database before exporting.")
+
+
+class PartitionWriter:
+    """
+    Writes rows into one CSV part file per partition below `<table_dir>/season=<season>/division=<division>/`.
+
+    Part files are written under a temporary name and only renamed once the whole export succeeded, so readers never
+    see a partially written partition.
+    """
+    def __init__(self, table_dir, columns, run_id):
+        self.table_dir = table_dir
+        self.columns = columns
+        self.run_id = run_id
+        self.files = {}
+        self.writers = {}
+
+    def write(self, season, division, row):
+        partition = (season or "unknown", division or "unassigned")
+        if partition not in self.writers:
+            partition_dir = os.path.join(self.table_dir, f"season={partition[0]}", f"division={partition[1]}")
+            os.makedirs(partition_dir, exist_ok=True)
+            path = os.path.join(partition_dir, f"part-{self.run_id}.csv")
+            f = open(path + ".tmp", "w", newline="", encoding="utf-8")
+            self.files[partition] = (f, path)
+            self.writers[partition] = csv.writer(f)
+            self.writers[partition].writerow(self.columns)
+        self.writers[partition].writerow(row)
+
+    def close(self, commit=True):
+        for f, path in self.files.values():
+            f.close()
+            if commit:
+                os.replace(path + ".tmp", path)
+            else:
+                os.remove(path + ".tmp")
+
+
+async def stream_rows(db_path, query, params, writer, columns, watermark_column):
+    """
+    Streams the rows of a query into a partition writer, one cursor batch at a time.
+
+    Returns:
+        tuple: The number of rows written and the watermark column of the last row, or None.
+    """
+    season_index, division_index = columns.index("season"), columns.index("division")
+    watermark_index = columns.index(watermark_column)
+    count, last = 0, None
+    async with aiosqlite.connect(db_path) as db:
+        async with db.execute(query, params) as cursor:
+            cursor.arraysize = 500
+            async for row in cursor:
+                writer.write(row[season_index], row[division_index], row)
+                count += 1
+                last = row[watermark_index]
+    return count, last
+
+
+def read_watermarks(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"matches": 0, "ratings": 0}
+
+
+def write_watermarks(path, watermarks):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(watermarks, f)
+    os.replace(path + ".tmp", path)
+
+
+async def export_league(league, out_dir=EXPORT_DIR):
+    """
+    Exports the matches and rating history of a league to CSV partitions by season and division.
+
+    Rows are partitioned by the season and division recorded on them when they were written (a match keeps the
+    season it was inserted in, a rating entry the division and season of the match it came from), not by the
+    current configuration, so later reassignments or season changes never move rows between partitions.
+
+    Only rows changed since the last export are written: matches are tracked by their change_seq and ratings by
+    their position in the append-only rating history. Updated matches are appended again, so consumers should keep
+    the row with the highest change_seq per match id. Rows are streamed from the databases, so memory use does not
+    grow with the size of the tables.
+
+    Parameters:
+        league (League): The league to export.
+        out_dir (str): Directory the league's exports are written below.
+
+    Returns:
+        dict: The number of exported rows per table.
+
+    Raises:
+        ExportError: If another export of the league is running or a database has not been upgraded yet.
+    """
+    league_dir = os.path.join(out_dir, league.name)
+    os.makedirs(league_dir, exist_ok=True)
+    with export_lock(os.path.join(league_dir, "export.lock")):
+        return await export_locked(league, league_dir)
+
+
+async def export_locked(league, league_dir):
+    watermark_path = os.path.join(league_dir, "watermark.json")
+    watermarks = read_watermarks(watermark_path)
+    # Unique per run, so part files of two runs never replace each other
+    run_id = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+    exported = {"matches": 0, "ratings": 0}
+
+    if os.path.exists(league.match_db_path):
+        await check_schema(league.match_db_path, "matches", ["change_seq", "season"])
+    if os.path.exists(league.elo_db_path):
+        await check_schema(league.elo_db_path, "rating_history", ["division", "season"])
+
+    if os.path.exists(league.match_db_path):
+        writer = PartitionWriter(os.path.join(league_dir, "matches"), MATCH_COLUMNS, run_id)
+        try:
+            count, last = await stream_rows(
+                league.match_db_path,
+                f"SELECT {', '.join(MATCH_COLUMNS)} FROM matches WHERE change_seq > ? ORDER BY change_seq",
+                (watermarks["matches"],), writer, MATCH_COLUMNS, "change_seq")
+        except BaseException:
+            writer.close(commit=False)
+            raise
+        writer.close()
+        if last is not None:
+            exported["matches"], watermarks["matches"] = count, last
+
+    if os.path.exists(league.elo_db_path):
+        writer = PartitionWriter(os.path.join(league_dir, "ratings"), RATING_COLUMNS, run_id)
+        try:
+            count, last = await stream_rows(
+                league.elo_db_path,
+                "SELECT rowid, discord_id, ts, elo, match_id, division, season FROM rating_history WHERE rowid > ? "
+                "ORDER BY rowid",
+                (watermarks["ratings"],), writer, RATING_COLUMNS, "seq")
+        except BaseException:
+            writer.close(commit=False)
+            raise
+        writer.close()
+        if last is not None:
+            exported["ratings"], watermarks["ratings"] = count, last
+
+    write_watermarks(watermark_path, watermarks)
+    return exported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export matches and ratings to CSV partitions by season and "
+                                                 "division.")
+    parser.add_argument("--leagues-file", default="leagues.json", help="League configuration file")
+    parser.add_argument("--league", action="append", help="League to export, may be repeated (default: all)")
+    parser.add_argument("--out", default=EXPORT_DIR, help="Output directory")
+    args = parser.parse_args(argv)
+
+    leagues = load_leagues(args.leagues_file, args.league)
+    for league in leagues.values():
+        try:
+            exported = asyncio.run(export_league(league, args.out))
+        except ExportError as e:
+            raise SystemExit(f"{league.name}: {e}")
+        print(f"{league.name}: exported {exported['matches']} match row(s) and {exported['ratings']} rating row(s)")
+
+
+if __name__ == "__main__":
+    main()
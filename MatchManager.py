@@ -1,18 +1,17 @@
+import os
+
 import gspread
 import aiosqlite
 from oauth2client.service_account import ServiceAccountCredentials
 
 
 class MatchManager:
-    def __init__(self, db_path='matches.db', credentials_path='scda-matchbot.json'):
-        self.db_path = db_path
+    def __init__(self, league, credentials_path='scda-matchbot.json'):
+        self.league = league
+        self.db_path = league.match_db_path
         self.credentials_path = credentials_path
         self.gc = None
-        self.ultra_key = ""
-        self.poke_key = ""
-        self.premier_key = ''
-        self.test_key = ''
-        self.output_key = ''
+        self.output_key = league.output_key
         self.setup_gspread_client()
 
     def setup_gspread_client(self):
@@ -23,9 +22,13 @@ class MatchManager:
     async def setup_match_database(self):
         """
         Asynchronously sets up the database for match data.
-        This function creates a table for matches if it doesn't exist.
+        This function creates the league's shard directory and a table for matches if it doesn't exist.
+        Every insert or update of a match stamps it with the next change_seq, which the analytics export uses as its
+        watermark. Matches keep the season they were inserted in, so later result updates stay in that season.
         """
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("PRAGMA journal_mode=WAL")
             await db.execute('''
                 CREATE TABLE IF NOT EXISTS matches (
                     id TEXT PRIMARY KEY,
@@ -38,17 +41,30 @@ class MatchManager:
                     replay_url1 TEXT DEFAULT NULL,
                     replay_url2 TEXT DEFAULT NULL,
                     replay_url3 TEXT DEFAULT NULL,
-                    division TEXT DEFAULT NULL
+                    division TEXT DEFAULT NULL,
+                    change_seq INTEGER DEFAULT NULL,
+                    season TEXT DEFAULT NULL
                 )
             ''')
+            # Databases from before change tracking and seasons get the columns, a sequence number and the current season
+            async with db.execute("PRAGMA table_info(matches)") as cursor:
+                columns = [column[1] for column in await cursor.fetchall()]
+            if "change_seq" not in columns:
+                await db.execute("ALTER TABLE matches ADD COLUMN change_seq INTEGER DEFAULT NULL")
+                await db.execute("UPDATE matches SET change_seq = rowid")
+            if "season" not in columns:
+                await db.execute("ALTER TABLE matches ADD COLUMN season TEXT DEFAULT NULL")
+                await db.execute("UPDATE matches SET season = ?", (self.league.season,))
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_matches_change_seq ON matches (change_seq)")
             await db.commit()
-            print("Finished setting up matches database")
+            print(f"Finished setting up matches database for {self.league.name}")
 
     async def insert_matches_into_db(self, matches):
         async with aiosqlite.connect(self.db_path) as db:
             for match in matches:
-                await db.execute('''INSERT INTO matches (id, week_number, team1, team2, division)
-                                    VALUES (?, ?, ?, ?, ?)''', match)
+                await db.execute('''INSERT INTO matches (id, week_number, team1, team2, division, season, change_seq)
+                                    VALUES (?, ?, ?, ?, ?, ?, (SELECT COALESCE(MAX(change_seq), 0) + 1 FROM matches))''',
+                                 (*match, self.league.season))
             await db.commit()
 
     # Function to extract unique team names
@@ -171,16 +187,7 @@ class MatchManager:
         return shown_matches
 
     def set_sheet_id_by_division(self, division_name):
-        if division_name == "Ultra":
-            return self.ultra_key
-        elif division_name == "Poke":
-            return self.poke_key
-        elif division_name == "Premier":
-            return self.premier_key
-        elif division_name == "Test":
-            return self.test_key
-        else:
-            raise ValueError(f"Unknown division name: {division_name}")
+        return self.league.division(division_name).sheet_key
 
     async def add_matches_for_division(self, division_name):
         sheet_id = self.set_sheet_id_by_division(division_name)
@@ -230,7 +237,8 @@ class MatchManager:
                 url3 = urls[2]
         async with aiosqlite.connect(self.db_path) as db:
             await db.execute("UPDATE matches SET score_team1=?, score_team2=?, match_played=1, "
-                             "replay_url1=?, replay_url2=?, replay_url3=? WHERE id=?",
+                             "replay_url1=?, replay_url2=?, replay_url3=?, "
+                             "change_seq=(SELECT COALESCE(MAX(change_seq), 0) + 1 FROM matches) WHERE id=?",
                              (score_team1, score_team2, url1, url2, url3, match_id))
             await db.commit()
         await self.write_matches_to_sheet()
@@ -0,0 +1,215 @@
+import asyncio
+import time
+from collections import deque
+
+import aiosqlite
+import discord
+
+MAX_MESSAGE_LENGTH = 2000  # Discord's limit for the content of a single message
+MAX_ATTEMPTS = 5  # Sends that fail with a rate limit, server or connection error are retried this many times
+
+
+def split_content(content):
+    """
+    Splits content into parts that fit in a single message, preferably at line breaks.
+    """
+    parts = []
+    while len(content) > MAX_MESSAGE_LENGTH:
+        cut = content.rfind("\n", 0, MAX_MESSAGE_LENGTH + 1)
+        if cut <= 0:
+            cut = MAX_MESSAGE_LENGTH
+        parts.append(content[:cut])
+        content = content[cut:].lstrip("\n")
+    parts.append(content)
+    return parts
+
+
+class TokenBucket:
+    """
+    A token bucket that allows `capacity` sends per `per` seconds, refilling continuously.
+    """
+    def __init__(self, capacity=5, per=5.0):
+        self.capacity = capacity
+        self.rate = capacity / per
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        """
+        Takes a token from the bucket.
+
+        Returns:
+            float: The number of seconds to wait before the reserved token may be used, 0 if it is available now.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class MessageQueue:
+    """
+    Outbound message queue with a token bucket per channel.
+
+    Messages are persisted before they are queued and removed once they have been delivered, so notifications that
+    were not sent yet survive a restart. Plain text notifications waiting for the same channel are batched into a
+    single message. Messages with a view are sent on their own and are not persisted, as views do not survive a
+    restart.
+
+    Attributes:
+        db_path (str): Path to the SQLite database the unsent messages are stored in.
+        bot (discord.Bot): The bot used to resolve channels.
+    """
+    def __init__(self, db_path, bot, capacity=5, per=5.0):
+        self.db_path = db_path
+        self.bot = bot
+        self.capacity = capacity
+        self.per = per
+        self.buckets = {}
+        self.pending = {}
+        self.workers = {}
+        self.started = False
+        self.setup_lock = asyncio.Lock()
+
+    async def setup(self):
+        """
+        Creates the outbox table if it doesn't exist and requeues every message that was not sent before a restart.
+        """
+        async with self.setup_lock:
+            if self.started:
+                return
+            await self.load()
+            self.started = True
+            for channel_id in self.pending:
+                self.start_worker(channel_id)
+
+    async def load(self):
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute('''CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, 
+            channel_id INTEGER, content TEXT)''')
+            await db.commit()
+            async with db.execute('SELECT id, channel_id, content FROM outbox ORDER BY id') as cursor:
+                async for message_id, channel_id, content in cursor:
+                    self.pending.setdefault(channel_id, deque()).append((message_id, content, None, None))
+
+    async def send(self, channel_id, content, view=None):
+        """
+        Queues a message for a channel and returns immediately.
+
+        Parameters:
+            channel_id (int): The channel to send the message to.
+            content (str): The message content. Plain text longer than a single message is split into several
+                           messages; content with a view is truncated.
+            view (discord.ui.View): Optional view to attach, the message is then neither batched nor persisted.
+
+        Returns:
+            asyncio.Future: For messages with a view, resolves to the sent discord.Message (None if it could not be
+                            delivered), so the message can be edited later. None for plain text notifications.
+        """
+        await self.setup()
+        pending = self.pending.setdefault(channel_id, deque())
+        sent = None
+        if view is None:
+            async with aiosqlite.connect(self.db_path) as db:
+                for part in split_content(content):
+                    cursor = await db.execute('INSERT INTO outbox (channel_id, content) VALUES (?, ?)',
+                                              (channel_id, part))
+                    pending.append((cursor.lastrowid, part, None, None))
+                await db.commit()
+        else:
+            if len(content) > MAX_MESSAGE_LENGTH:
+                content = content[:MAX_MESSAGE_LENGTH - 1] + "…"
+            sent = asyncio.get_running_loop().create_future()
+            pending.append((None, content, view, sent))
+        self.start_worker(channel_id)
+        return sent
+
+    def start_worker(self, channel_id):
+        if channel_id not in self.workers:
+            self.workers[channel_id] = asyncio.create_task(self.drain(channel_id))
+
+    @staticmethod
+    def next_batch(pending):
+        """
+        Pops the next message to send from a channel's queue, joining consecutive plain text notifications as long as
+        they fit in a single message.
+
+        Returns:
+            tuple: A list of the persisted ids in the batch, the content, the view to send and its future.
+        """
+        message_id, content, view, sent = pending.popleft()
+        ids = [message_id] if message_id is not None else []
+        if view is not None:
+            return ids, content, view, sent
+        while pending and pending[0][2] is None and len(content) + 1 + len(pending[0][1]) <= MAX_MESSAGE_LENGTH:
+            message_id, next_content, _, _ = pending.popleft()
+            ids.append(message_id)
+            content += "\n" + next_content
+        return ids, content, None, None
+
+    async def drain(self, channel_id):
+        """
+        Sends the queued messages for a channel while respecting its token bucket. Messages queued while waiting for
+        a token are batched with the ones already waiting.
+
+        Rate limits, server errors and connection errors are retried up to MAX_ATTEMPTS times, any other error
+        (e.g. a 400 for invalid content) drops the batch, so one bad message never blocks the channel.
+        """
+        bucket = self.buckets.setdefault(channel_id, TokenBucket(self.capacity, self.per))
+        pending = self.pending[channel_id]
+        attempts = 0
+        sent = None
+        try:
+            while pending:
+                await asyncio.sleep(bucket.reserve())
+                ids, content, view, sent = self.next_batch(pending)
+                message = None
+                try:
+                    channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+                    if view is None:
+                        message = await channel.send(content)
+                    else:
+                        message = await channel.send(content, view=view)
+                except Exception as e:
+                    retryable = not isinstance(e, discord.HTTPException) or e.status == 429 or e.status >= 500
+                    attempts += 1
+                    if retryable and attempts < MAX_ATTEMPTS:
+                        print(f"Failed to send message to channel {channel_id}, retrying ({attempts}/"
+                              f"{MAX_ATTEMPTS}): {e!r}")
+                        pending.appendleft(await self.merge(ids, content, view, sent))
+                        await asyncio.sleep(self.per * attempts)
+                        continue
+                    print(f"Dropping message for channel {channel_id}: {e!r}")
+                attempts = 0
+                if sent is not None and not sent.done():
+                    sent.set_result(message)
+                await self.delete(ids)
+        finally:
+            del self.workers[channel_id]
+            # Never leave a caller waiting on a message this worker can no longer deliver
+            for entry_sent in [sent] + [entry[3] for entry in pending]:
+                if entry_sent is not None and not entry_sent.done():
+                    entry_sent.set_result(None)
+
+    async def merge(self, ids, content, view, sent):
+        """
+        Stores a batch that failed to send as a single persisted message, so it is retried as a whole.
+
+        Returns:
+            tuple: The queue entry for the merged batch.
+        """
+        if not ids:
+            return None, content, view, sent
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute('UPDATE outbox SET content = ? WHERE id = ?', (content, ids[0]))
+            await db.executemany('DELETE FROM outbox WHERE id = ?', [(message_id,) for message_id in ids[1:]])
+            await db.commit()
+        return ids[0], content, view, sent
+
+    async def delete(self, ids):
+        if not ids:
+            return
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany('DELETE FROM outbox WHERE id = ?', [(message_id,) for message_id in ids])
+            await db.commit()
@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+from typing import NamedTuple
+from urllib.parse import urlsplit, urlunsplit
+
+import aiohttp
+
+SHOWDOWN_REPLAY_ORIGIN = "https://replay.pokemonshowdown.com"
+
+
+class Replay(NamedTuple):
+    url: str
+    players: tuple
+    winner: str
+
+
+class Verification(NamedTuple):
+    verified: bool
+    summary: str
+
+
+def to_id(name):
+    """Normalises a player name the way Showdown does for user IDs: lowercase, alphanumeric only."""
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+def origin(url):
+    scheme, netloc, _, _, _ = urlsplit(url.strip())
+    return f"{scheme.lower()}://{netloc.lower()}"
+
+
+def log_url(url):
+    """
+    Returns the URL of the raw battle log for a replay URL, e.g. https://replay.pokemonshowdown.com/gen9ou-1 becomes
+    https://replay.pokemonshowdown.com/gen9ou-1.log
+    """
+    scheme, netloc, path, _, _ = urlsplit(url.strip())
+    scheme, netloc = scheme.lower(), netloc.lower()
+    path = path.rstrip("/")
+    if not path.endswith(".log"):
+        path += ".log"
+    return urlunsplit((scheme, netloc, path, "", ""))
+
+
+class LogParser:
+    """
+    Incremental parser for Showdown battle logs; lines are fed one at a time so the log never has to be held in
+    memory as a whole.
+    """
+    def __init__(self):
+        self.players = {}
+        self.winner = None
+
+    def feed(self, line):
+        """
+        Parses a single log line.
+
+        Returns:
+            bool: True once the winner is known and the rest of the log can be skipped.
+        """
+        parts = line.rstrip("\r\n").split("|")
+        if len(parts) > 3 and parts[1] == "player" and parts[3]:
+            self.players[parts[2]] = parts[3]
+        elif len(parts) > 2 and parts[1] == "win":
+            self.winner = parts[2]
+        return self.winner is not None
+
+    def result(self, url):
+        if len(self.players) != 2 or self.winner is None:
+            raise ValueError(f"Incomplete battle log: {url}")
+        return Replay(url, tuple(self.players[side] for side in sorted(self.players)), self.winner)
+
+
+class ReplayVerifier:
+    """
+    Fetches replay logs in the background and cross-checks them against submitted match scores.
+
+    Logs are fetched over one shared HTTP session with at most `concurrency` requests in flight. Parsed results are
+    stored in a content-addressed on-disk cache (keyed by the SHA-256 of the log URL), so every replay is only
+    fetched once. Only URLs on one of the allowed origins are fetched, and redirects are not followed, so users
+    cannot make the bot request arbitrary (e.g. internal) addresses.
+
+    Attributes:
+        cache_dir (str): Directory the parsed replays are cached in.
+        concurrency (int): Maximum number of replay logs fetched at the same time.
+        allowed_origins (tuple): Scheme and host (with port, if any) replays may be fetched from.
+    """
+    def __init__(self, cache_dir, concurrency=4, timeout=15, allowed_origins=(SHOWDOWN_REPLAY_ORIGIN,)):
+        self.cache_dir = cache_dir
+        self.allowed_origins = {origin(allowed) for allowed in allowed_origins}
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+        self.in_flight = {}
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def cache_path(self, url):
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + ".json")
+
+    def read_cache(self, url):
+        try:
+            with open(self.cache_path(url), encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        return Replay(url, tuple(entry["players"]), entry["winner"])
+
+    def write_cache(self, replay):
+        path = self.cache_path(replay.url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"players": replay.players, "winner": replay.winner}, f)
+        os.replace(tmp_path, path)  # Atomic, so a crash never leaves a partial cache entry behind
+
+    def is_allowed(self, url):
+        return origin(url) in self.allowed_origins
+
+    async def fetch(self, url):
+        """
+        Returns the parsed replay for a URL, from the cache when possible. Concurrent requests for the same replay
+        share a single download.
+
+        Raises:
+            ValueError: If the URL is not on one of the allowed origins.
+        """
+        if not self.is_allowed(url):
+            raise ValueError(f"Not an allowed replay URL: {url}")
+        url = log_url(url)
+        replay = self.read_cache(url)
+        if replay is not None:
+            return replay
+        if url not in self.in_flight:
+            self.in_flight[url] = asyncio.ensure_future(self.download(url))
+        try:
+            return await asyncio.shield(self.in_flight[url])
+        finally:
+            if url in self.in_flight and self.in_flight[url].done():
+                del self.in_flight[url]
+
+    async def download(self, url):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=self.timeout)
+        parser = LogParser()
+        async with self.semaphore:
+            async with self.session.get(url, allow_redirects=False) as response:
+                response.raise_for_status()
+                async for line in response.content:
+                    if parser.feed(line.decode("utf-8", errors="replace")):
+                        break
+        replay = parser.result(url)
+        self.write_cache(replay)
+        return replay
+
+    async def verify(self, urls, score, submitter, opponent):
+        """
+        Cross-checks the replays of a match against the submitted score.
+
+        Parameters:
+            urls (list): The submitted replay URLs.
+            score (str): The submitted score from the submitter's point of view, e.g. "2-1".
+            submitter (str): Name of the submitting player.
+            opponent (str): Name of the opponent.
+
+        Returns:
+            Verification: Whether the replays match the score, with a one-line summary for moderators.
+        """
+        if not urls:
+            return Verification(False, "❔ No replays submitted")
+        # Replays are referred to by position, so user-supplied URLs are never echoed into the moderator message
+        rejected = [str(i) for i, url in enumerate(urls, 1) if not self.is_allowed(url)]
+        if rejected:
+            return Verification(False, f"⚠️ Replay(s) {', '.join(rejected)} are not Showdown replay links")
+        if len({log_url(url) for url in urls}) != len(urls):
+            return Verification(False, "⚠️ The same replay was submitted more than once")
+        replays = await asyncio.gather(*(self.fetch(url) for url in urls), return_exceptions=True)
+        failed = [str(i) for i, replay in enumerate(replays, 1) if isinstance(replay, BaseException)]
+        if failed:
+            return Verification(False, f"❔ Could not read replay(s) {', '.join(failed)}")
+
+        players = {to_id(name) for name in replays[0].players}
+        if any({to_id(name) for name in replay.players} != players for replay in replays):
+            return Verification(False, "⚠️ Replays are not all between the same two players")
+
+        wins = {to_id(name): 0 for name in replays[0].players}
+        names = {to_id(name): name for name in replays[0].players}
+        for replay in replays:
+            wins[to_id(replay.winner)] = wins.get(to_id(replay.winner), 0) + 1
+        submitted = [int(games) for games in score.split("-")]
+
+        # Compare per player when the Showdown names match the Discord names, otherwise only the series result
+        submitter_id, opponent_id = to_id(submitter), to_id(opponent)
+        if submitter_id in wins and opponent_id in wins:
+            derived = [wins[submitter_id], wins[opponent_id]]
+            matches = derived == submitted
+        else:
+            derived = sorted(wins.values(), reverse=True)
+            matches = derived == sorted(submitted, reverse=True)
+        leader, trailer = sorted(names, key=lambda player: wins[player], reverse=True)
+        series = f"{names[leader]} {wins[leader]}-{wins[trailer]} {names[trailer]}"
+        if matches:
+            return Verification(True, f"✅ Replays match the submitted score ({series})")
+        return Verification(False, f"⚠️ Replays show {series}, submitted {score}")
@@ -0,0 +1,135 @@
+import asyncio
+import csv
+import glob
+import json
+import os
+import sqlite3
+import sys
+from types import MappingProxyType
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import MatchExport  # noqa: E402
+from LeagueConfig import League, Division  # noqa: E402
+
+NEXT_SEQ = "(SELECT COALESCE(MAX(change_seq), 0) + 1 FROM matches)"
+
+
+@pytest.fixture
+def league(tmp_path, monkeypatch):
+    """A league whose shard lives in tmp_path, with the schema the bot creates."""
+    monkeypatch.chdir(tmp_path)
+    league = League(name="Test", guild_id=1, moderator_channel_id=2, leaderboard_channel_id=3, output_key="",
+                    divisions=MappingProxyType({"Ultra": Division("Ultra", "", 16), "Poke": Division("Poke", "", 32)}),
+                    season="1")
+    os.makedirs(league.data_dir)
+    with sqlite3.connect(league.match_db_path) as db:
+        db.execute("CREATE TABLE matches (id TEXT PRIMARY KEY, week_number INTEGER, team1 TEXT, team2 TEXT, "
+                   "score_team1 INTEGER, score_team2 INTEGER, match_played BOOLEAN DEFAULT 0, replay_url1 TEXT, "
+                   "replay_url2 TEXT, replay_url3 TEXT, division TEXT, change_seq INTEGER, season TEXT)")
+    with sqlite3.connect(league.elo_db_path) as db:
+        db.execute("CREATE TABLE players (discord_id TEXT PRIMARY KEY, elo INTEGER, division TEXT)")
+        db.execute("CREATE TABLE rating_history (discord_id TEXT NOT NULL, ts INTEGER NOT NULL, elo REAL NOT NULL, "
+                   "match_id TEXT, division TEXT, season TEXT)")
+    return league
+
+
+def insert_match(league, match_id, division, season="1"):
+    with sqlite3.connect(league.match_db_path) as db:
+        db.execute(f"INSERT INTO matches (id, week_number, team1, team2, division, season, change_seq) "
+                   f"VALUES (?, 1, 'A', 'B', ?, ?, {NEXT_SEQ})", (match_id, division, season))
+
+
+def play_match(league, match_id):
+    with sqlite3.connect(league.match_db_path) as db:
+        db.execute(f"UPDATE matches SET score_team1 = 2, score_team2 = -2, match_played = 1, change_seq = {NEXT_SEQ} "
+                   f"WHERE id = ?", (match_id,))
+
+
+def add_rating(league, discord_id, elo, division):
+    with sqlite3.connect(league.elo_db_path) as db:
+        db.execute("INSERT INTO rating_history (discord_id, ts, elo, division, season) VALUES (?, 0, ?, ?, '1')",
+                   (discord_id, elo, division))
+
+
+def exported_rows(pattern):
+    rows = []
+    for path in sorted(glob.glob(os.path.join("exports", "Test", pattern, "part-*.csv"))):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows.extend(csv.DictReader(f))
+    return rows
+
+
+def export(league):
+    return asyncio.run(MatchExport.export_league(league))
+
+
+def test_second_export_only_writes_changed_rows(league):
+    insert_match(league, "m1", "Ultra")
+    insert_match(league, "m2", "Poke")
+    add_rating(league, "10", 1200, None)
+    assert export(league) == {"matches": 2, "ratings": 1}
+
+    play_match(league, "m1")
+    insert_match(league, "m3", "Ultra")
+    add_rating(league, "10", 1216, "Ultra")
+    assert export(league) == {"matches": 2, "ratings": 1}
+    assert export(league) == {"matches": 0, "ratings": 0}
+
+    ultra = exported_rows("matches/season=1/division=Ultra")
+    assert [(row["id"], row["match_played"], row["change_seq"]) for row in ultra] == \
+        [("m1", "0", "1"), ("m1", "1", "3"), ("m3", "0", "4")]  # The update is appended with a higher change_seq
+    assert [row["id"] for row in exported_rows("matches/season=1/division=Poke")] == ["m2"]
+    assert [row["elo"] for row in exported_rows("ratings/season=1/division=unassigned")] == ["1200.0"]
+    assert [row["elo"] for row in exported_rows("ratings/season=1/division=Ultra")] == ["1216.0"]
+    with open(os.path.join("exports", "Test", "watermark.json"), encoding="utf-8") as f:
+        assert json.load(f) == {"matches": 4, "ratings": 2}
+
+
+def test_rows_keep_the_season_they_were_written_in(league):
+    insert_match(league, "old", "Ultra", season="1")
+    export(league)
+    play_match(league, "old")  # Result of a previous season's match updated after the season moved on
+    export(league._replace(season="2"))
+    assert [row["id"] for row in exported_rows("matches/season=1/division=Ultra")] == ["old", "old"]
+    assert exported_rows("matches/season=2/*") == []
+
+
+def test_failed_export_publishes_nothing_and_keeps_the_watermark(league, monkeypatch):
+    insert_match(league, "m1", "Ultra")
+    insert_match(league, "m2", "Ultra")
+    write = MatchExport.PartitionWriter.write
+    calls = []
+
+    def failing_write(self, season, division, row):
+        calls.append(row)
+        if len(calls) == 2:
+            raise OSError("disk full")
+        write(self, season, division, row)
+
+    monkeypatch.setattr(MatchExport.PartitionWriter, "write", failing_write)
+    with pytest.raises(OSError):
+        export(league)
+    assert [name for _, _, files in os.walk("exports") for name in files] == ["export.lock"]  # No part files
+    assert not os.path.exists(os.path.join("exports", "Test", "watermark.json"))
+
+    monkeypatch.setattr(MatchExport.PartitionWriter, "write", write)
+    assert export(league)["matches"] == 2
+
+
+def test_concurrent_export_is_refused(league):
+    os.makedirs(os.path.join("exports", "Test"))
+    with MatchExport.export_lock(os.path.join("exports", "Test", "export.lock")):
+        with pytest.raises(MatchExport.ExportError):
+            export(league)
+    assert export(league) == {"matches": 0, "ratings": 0}
+
+
+def test_database_without_upgrade_is_reported(league):
+    with sqlite3.connect(league.match_db_path) as db:
+        db.execute("DROP TABLE matches")
+        db.execute("CREATE TABLE matches (id TEXT PRIMARY KEY, division TEXT)")
+    with pytest.raises(MatchExport.ExportError, match="start the bot once"):
+        export(league)
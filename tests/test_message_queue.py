@@ -0,0 +1,128 @@
+import asyncio
+import os
+import sqlite3
+import sys
+from types import SimpleNamespace
+
+import discord
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import MessageQueue  # noqa: E402
+
+
+def http_error(status):
+    return discord.HTTPException(SimpleNamespace(status=status, reason="stub"), "stub error")
+
+
+class StubChannel:
+    """Records sent messages; raises the queued `failures` on the next sends."""
+    def __init__(self):
+        self.sent = []
+        self.failures = []
+
+    async def send(self, content, view=None):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.sent.append((content, view))
+        return SimpleNamespace(content=content)
+
+
+class StubBot:
+    def __init__(self):
+        self.channel = StubChannel()
+
+    def get_channel(self, channel_id):
+        return self.channel
+
+
+def outbox_rows(db_path):
+    with sqlite3.connect(db_path) as db:
+        return db.execute("SELECT id, channel_id, content FROM outbox ORDER BY id").fetchall()
+
+
+async def drained(queue):
+    while queue.workers:
+        await asyncio.gather(*queue.workers.values())
+
+
+def test_plain_texts_are_batched_and_views_are_not(tmp_path):
+    async def check():
+        bot = StubBot()
+        queue = MessageQueue.MessageQueue(str(tmp_path / "outbox.db"), bot, capacity=1, per=0.05)
+        queue.buckets[1] = MessageQueue.TokenBucket(1, 0.05)
+        queue.buckets[1].reserve()  # Empty the bucket, so everything below is waiting when the first send happens
+        await queue.send(1, "first")
+        await queue.send(1, "second")
+        sent = await queue.send(1, "review me", view="view")
+        await queue.send(1, "third")
+        await drained(queue)
+        assert bot.channel.sent == [("first\nsecond", None), ("review me", "view"), ("third", None)]
+        assert (await sent).content == "review me"
+        assert outbox_rows(queue.db_path) == []
+
+    asyncio.run(check())
+
+
+def test_long_content_is_split():
+    parts = MessageQueue.split_content("a" * 1500 + "\n" + "b" * 1500)
+    assert parts == ["a" * 1500, "b" * 1500]
+    assert all(len(part) <= MessageQueue.MAX_MESSAGE_LENGTH for part in MessageQueue.split_content("c" * 4500))
+
+
+def test_transient_failure_is_retried_with_merged_row(tmp_path, monkeypatch):
+    async def check():
+        bot = StubBot()
+        queue = MessageQueue.MessageQueue(str(tmp_path / "outbox.db"), bot, capacity=1, per=0.05)
+        merged_rows = []
+        merge = queue.merge
+
+        async def recording_merge(*args):
+            entry = await merge(*args)
+            merged_rows.extend(outbox_rows(queue.db_path))
+            return entry
+
+        monkeypatch.setattr(queue, "merge", recording_merge)
+        queue.buckets[1] = MessageQueue.TokenBucket(1, 0.05)
+        queue.buckets[1].reserve()  # Empty the bucket, so both messages are waiting when the first send happens
+        bot.channel.failures = [http_error(503)]
+        await queue.send(1, "one")
+        await queue.send(1, "two")
+        await drained(queue)
+        assert [row[2] for row in merged_rows] == ["one\ntwo"]  # Stored as a single row while waiting for the retry
+        assert bot.channel.sent == [("one\ntwo", None)]
+        assert outbox_rows(queue.db_path) == []
+
+    asyncio.run(check())
+
+
+def test_permanent_failure_drops_message_and_resolves_future(tmp_path):
+    async def check():
+        bot = StubBot()
+        queue = MessageQueue.MessageQueue(str(tmp_path / "outbox.db"), bot, per=0.01)
+        bot.channel.failures = [http_error(400)]
+        sent = await queue.send(1, "rejected", view="view")
+        await queue.send(1, "next")
+        await drained(queue)
+        assert await sent is None
+        assert bot.channel.sent == [("next", None)]
+
+    asyncio.run(check())
+
+
+def test_unsent_rows_are_reloaded_on_setup(tmp_path):
+    db_path = str(tmp_path / "outbox.db")
+    with sqlite3.connect(db_path) as db:
+        db.execute("CREATE TABLE outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, channel_id INTEGER, content TEXT)")
+        db.executemany("INSERT INTO outbox (channel_id, content) VALUES (?, ?)",
+                       [(1, "left over"), (2, "other channel"), (1, "also left over")])
+
+    async def check():
+        bot = StubBot()
+        queue = MessageQueue.MessageQueue(db_path, bot, per=0.01)
+        await queue.setup()
+        await drained(queue)
+        assert sorted(bot.channel.sent) == [("left over\nalso left over", None), ("other channel", None)]
+        assert outbox_rows(db_path) == []
+
+    asyncio.run(check())
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import sys
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ReplayVerifier import ReplayVerifier, log_url  # noqa: E402
+
+REPLAY_DIR = os.path.join(os.path.dirname(__file__), "replays")
+
+
+async def run_with_stub(check, tmp_path):
+    """Serves the recorded logs in tests/replays from a local HTTP stub and runs `check(verifier, base_url, hits)`."""
+    hits = []
+
+    async def handler(request):
+        hits.append(request.path)
+        path = os.path.join(REPLAY_DIR, os.path.basename(request.path))
+        if not os.path.exists(path):
+            raise web.HTTPNotFound()
+        return web.FileResponse(path)
+
+    app = web.Application()
+    app.router.add_get("/{name}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    base_url = f"http://127.0.0.1:{port}"
+    verifier = ReplayVerifier(str(tmp_path), concurrency=2, allowed_origins=(base_url,))
+    try:
+        await check(verifier, base_url, hits)
+    finally:
+        await verifier.close()
+        await runner.cleanup()
+
+
+def test_log_url():
+    assert log_url("https://replay.pokemonshowdown.com/gen9ou-1?p2") == "https://replay.pokemonshowdown.com/gen9ou-1.log"
+    assert log_url("https://replay.pokemonshowdown.com/gen9ou-1.log") == "https://replay.pokemonshowdown.com/gen9ou-1.log"
+
+
+def test_matching_score_fetches_each_replay_once(tmp_path):
+    async def check(verifier, base_url, hits):
+        urls = [f"{base_url}/gen9ou-{i}" for i in (2001, 2002, 2003)]
+        result = await verifier.verify(urls, "2-1", "ashk", "Gary Oak")
+        assert result.verified, result.summary
+        assert "Ash K 2-1 Gary Oak" in result.summary
+        assert not (await verifier.verify(urls, "1-2", "ashk", "Gary Oak")).verified
+        assert (await verifier.verify(urls, "2-1", "unknown", "names")).verified
+        assert sorted(hits) == ["/gen9ou-2001.log", "/gen9ou-2002.log", "/gen9ou-2003.log"]
+
+    asyncio.run(run_with_stub(check, tmp_path))
+
+
+def test_duplicate_replays_are_a_mismatch(tmp_path):
+    async def check(verifier, base_url, hits):
+        result = await verifier.verify([f"{base_url}/gen9ou-2001", f"{base_url}/gen9ou-2001.log"], "2-0", "Ash K",
+                                       "Gary Oak")
+        assert not result.verified
+        assert hits == []
+
+    asyncio.run(run_with_stub(check, tmp_path))
+
+
+def test_missing_and_disallowed_replays(tmp_path):
+    async def check(verifier, base_url, hits):
+        result = await verifier.verify([f"{base_url}/gen9ou-9999"], "2-0", "Ash K", "Gary Oak")
+        assert not result.verified
+        assert "9999" not in result.summary
+        result = await verifier.verify(["http://169.254.169.254/latest", f"{base_url}/gen9ou-2001"], "2-0", "Ash K",
+                                       "Gary Oak")
+        assert not result.verified
+        assert "169.254" not in result.summary
+        assert hits == ["/gen9ou-9999.log"]
+
+    asyncio.run(run_with_stub(check, tmp_path))
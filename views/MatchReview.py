@@ -29,8 +29,8 @@ class MatchReview(discord.ui.View):
             interaction (discord.Interaction): The interaction generated by the button click.
         """
         await interaction.response.edit_message(content=f"Match {self.match[0]} submission accepted!", view=None)
-        await self.ctx.channel.send(f"<@{self.ctx.user.id}> your match submission has been accepted by"
-                                    f" {interaction.user}.")
+        await self.bot.queue_message(self.ctx, self.ctx.channel_id, f"<@{self.ctx.user.id}> your match submission has "
+                                                                    f"been accepted by {interaction.user}.")
         await self.bot.process_match_result(self.ctx, self.match, self.opp, self.score, self.urls, self.division)
 
     @discord.ui.button(label="Reject", style=discord.ButtonStyle.danger)
@@ -42,7 +42,8 @@ class MatchReview(discord.ui.View):
             _ (discord.ui.Button): The button clicked, unused.
             interaction (discord.Interaction): The interaction generated by the button click.
         """
-        modal = RejectionModal(title="Match Rejection Reason", ctx=self.ctx, original_interaction=interaction)
+        modal = RejectionModal(title="Match Rejection Reason", ctx=self.ctx, original_interaction=interaction,
+                               bot=self.bot)
         await interaction.response.send_modal(modal)
         await interaction.edit_original_response(content=f"Match {self.match[0]} submission rejected! (by "
                                                          f"{interaction.user.name})", view=None)
@@ -55,11 +56,13 @@ class RejectionModal(discord.ui.Modal):
     Attributes:
         ctx (discord.ApplicationContext): The context of the command that initiated the modal.
     """
-    def __init__(self, ctx, original_interaction, *args, **kwargs):
+    def __init__(self, ctx, original_interaction, bot, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.ctx = ctx
         self.original_interaction = original_interaction
-        self.add_item(discord.ui.InputText(label="Reason for Rejection", style=discord.InputTextStyle.short))
+        self.bot = bot
+        self.add_item(discord.ui.InputText(label="Reason for Rejection", style=discord.InputTextStyle.short,
+                                           max_length=1000))
 
     async def callback(self, interaction: discord.Interaction):
         """
@@ -68,7 +71,7 @@ class RejectionModal(discord.ui.Modal):
         Parameters:
             interaction (discord.Interaction): The interaction generated by the modal submission.
         """
-        # Send the reason to the original channel
-        await self.ctx.channel.send(f"<@{self.ctx.user.id}> your match submission has been rejected: "
-                                    f"{self.children[0].value}")
         await interaction.response.send_message("Rejection reason submitted successfully.", ephemeral=True)
+        # Queue the reason for the original channel
+        await self.bot.queue_message(self.ctx, self.ctx.channel_id, f"<@{self.ctx.user.id}> your match submission "
+                                                                    f"has been rejected: {self.children[0].value}")
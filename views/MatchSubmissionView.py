@@ -95,9 +95,9 @@ class ReplayModal(discord.ui.Modal):
         self.bot = bot
         self.original_interaction = interaction
 
-        self.add_item(discord.ui.InputText(label="Replay URL 1", required=False))
-        self.add_item(discord.ui.InputText(label="Replay URL 2", required=False))
-        self.add_item(discord.ui.InputText(label="Replay URL 3", required=False))
+        self.add_item(discord.ui.InputText(label="Replay URL 1", required=False, max_length=200))
+        self.add_item(discord.ui.InputText(label="Replay URL 2", required=False, max_length=200))
+        self.add_item(discord.ui.InputText(label="Replay URL 3", required=False, max_length=200))
 
     async def callback(self, interaction: discord.Interaction):
         urls = [self.children[0].value, self.children[1].value, self.children[2].value]
@@ -134,7 +134,8 @@ class ConfirmationView(discord.ui.View):
                f"Match: {self.match[0]}\n"
                f"Score: {self.score}\n"
                f"Replays: {'\n'.join(self.urls)}\n")
-        await self.moderator_channel.send(msg, view=view)
+        sent = await self.bot.queue_message(self.ctx, self.moderator_channel.id, msg, view=view)
+        self.bot.follow_up_submission(self.ctx, sent, self.match[0], self.urls, self.score, self.opp[0])
 
     @discord.ui.button(label="Reject", style=discord.ButtonStyle.danger)
     async def reject_button(self, _: discord.ui.Button, interaction: discord.Interaction):